@@ -0,0 +1,114 @@
+# Copyright 2025 Arm Limited and/or its affiliates.
+#
+# This source code is licensed under the BSD-style license found in the
+# LICENSE file in the root directory of this source tree.
+
+import re
+import sys
+import unittest
+from unittest.mock import patch
+
+from executorch.backends.arm.test import runner_utils
+from parameterized import parameterized
+
+# The regex _has_fvp_error replaces, which it must stay equivalent to.
+_OLD_FVP_ERROR_RE = re.compile(
+    r"(^[EF][: ].*$)|(^.*Hard fault.*$)|(^.*Assertion.*$)", re.MULTILINE
+)
+
+test_fvp_outputs = [
+    "",
+    "I [executorch:arm_executor_runner.cpp] Model executed\n",
+    "E: Failed to load program\n",
+    "F executor_runner aborted\n",
+    "ok\nE:\n",
+    "ok\nE\n",
+    "Error: not an FVP tag\n",
+    " E: indented\n",
+    "xE: mid line\n",
+    "cpu0: Hard fault at 0x0\n",
+    "Hard fault",
+    "ok\nAssertion 'x' failed\nok\n",
+    "Assert\n",
+    "hard fault\n",
+    "ok\r\nE: windows line ending\r\n",
+]
+
+
+def _run_fvp_child(code: str):
+    """Runs _run_fvp on a Python child process executing 'code', with small
+    chunks so that chunk boundaries are exercised."""
+    with patch.object(runner_utils, "_FVP_LOG_CHUNK_SIZE", 16), patch.object(
+        runner_utils, "_FVP_LOG_TAIL_CHUNKS", 2
+    ):
+        return runner_utils._run_fvp([sys.executable, "-c", code])
+
+
+class TestRunFvp(unittest.TestCase):
+    """Tests the chunked FVP stdout scanning in _run_fvp."""
+
+    def test_no_error_keeps_tail(self):
+        output = "".join(f"line {i}\n" for i in range(20))
+        code = f"import sys; sys.stdout.write({output!r})"
+        returncode, found_error, stdout, stderr = _run_fvp_child(code)
+
+        self.assertEqual(returncode, 0)
+        self.assertFalse(found_error)
+        self.assertEqual(stderr, "")
+        # Only the last chunks are kept on the success path.
+        self.assertLessEqual(len(stdout), 2 * 16)
+        self.assertTrue(stdout.endswith("line 19\n"))
+
+    def test_error_split_across_chunks(self):
+        # "Hard fault" straddles the 16 byte chunk boundary.
+        code = "import sys; sys.stdout.write('x' * 10 + ' Hard fault\\n')"
+        _, found_error, _, _ = _run_fvp_child(code)
+        self.assertTrue(found_error)
+
+    def test_line_start_error_split_across_chunks(self):
+        # "E" is the last byte of the first chunk and ": boom" starts the next.
+        code = "import sys; sys.stdout.write('a' * 14 + '\\nE: boom\\n')"
+        _, found_error, _, _ = _run_fvp_child(code)
+        self.assertTrue(found_error)
+
+    def test_error_on_trailing_line_without_newline(self):
+        code = "import sys; sys.stdout.write('a' * 40 + '\\nE: end')"
+        _, found_error, stdout, _ = _run_fvp_child(code)
+        self.assertTrue(found_error)
+        self.assertTrue(stdout.endswith("E: end"))
+
+    def test_keeps_all_output_after_error(self):
+        after = "".join(f"after {i}\n" for i in range(20))
+        code = f"import sys; sys.stdout.write('Assertion failed\\n' + {after!r})"
+        _, found_error, stdout, _ = _run_fvp_child(code)
+        self.assertTrue(found_error)
+        self.assertIn(after, stdout)
+
+    def test_no_false_positive(self):
+        # Lines starting with E/F but not followed by ':' or ' ' are not errors.
+        code = "import sys; sys.stdout.write('Exit 0\\nEnd\\nFine\\n' * 5)"
+        _, found_error, _, _ = _run_fvp_child(code)
+        self.assertFalse(found_error)
+
+    def test_stderr_and_returncode(self):
+        # Enough stderr to fill the pipe buffer if it were not drained.
+        code = (
+            "import sys; sys.stderr.write('e' * (1 << 20)); "
+            "sys.stdout.write('done\\n'); sys.exit(3)"
+        )
+        returncode, found_error, stdout, stderr = _run_fvp_child(code)
+        self.assertEqual(returncode, 3)
+        self.assertFalse(found_error)
+        self.assertEqual(stdout, "done\n")
+        self.assertEqual(stderr, "e" * (1 << 20))
+
+
+class TestHasFvpError(unittest.TestCase):
+    """Tests that _has_fvp_error matches the original FVP error regex."""
+
+    @parameterized.expand([(output,) for output in test_fvp_outputs])
+    def test_matches_old_regex(self, fvp_output: str):
+        self.assertEqual(
+            runner_utils._has_fvp_error(fvp_output),
+            _OLD_FVP_ERROR_RE.search(fvp_output) is not None,
+        )
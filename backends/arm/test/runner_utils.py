@@ -3,16 +3,22 @@
 # This source code is licensed under the BSD-style license found in the
 # LICENSE file in the root directory of this source tree.
 
+import codecs
+import collections
+import concurrent.futures
+import functools
 import json
 import logging
+import math
 import os
 import re
 import shutil
 import subprocess
 import tempfile
+import threading
 
 from pathlib import Path
-from typing import cast, Dict, List, Literal, Optional, Tuple
+from typing import Callable, cast, Dict, List, Literal, Optional, Tuple
 
 import numpy as np
 import torch
@@ -24,15 +30,48 @@ from executorch.backends.arm.tosa_specification import TosaSpecification
 from executorch.exir.lowered_backend_module import LoweredBackendModule
 
 from packaging.version import Version
+from torch._higher_order_ops.executorch_call_delegate import ExecutorchCallDelegate
+from torch.ao.quantization.fx._decomposed import quantized_decomposed_lib  # noqa: F401
 from torch.export import ExportedProgram
 from torch.fx.node import Node
 
 from torch.overrides import TorchFunctionMode
 from tosa import TosaGraph
 
+try:
+    import orjson
+
+    # orjson is considerably faster on the large flatc JSON dumps.
+    _json_loads = orjson.loads
+except ImportError:
+    _json_loads = json.loads
+
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.CRITICAL)
 
+_QPT = torch.ops.quantized_decomposed.quantize_per_tensor.default
+_DQPT = torch.ops.quantized_decomposed.dequantize_per_tensor.default
+
+_TORCH_TO_NUMPY = {
+    torch.float32: np.float32,
+    torch.int8: np.int8,
+    torch.uint8: np.uint8,
+    torch.int16: np.int16,
+    torch.int32: np.int32,
+    torch.bool: np.bool_,
+}
+
+# Number of elements quantized per block in _quantize, sized to stay in cache.
+_QUANTIZE_BLOCK_SIZE = 1 << 16
+
+# Chunk size used when streaming FVP stdout, and the number of trailing chunks
+# kept for error reporting.
+_FVP_LOG_CHUNK_SIZE = 1 << 20
+_FVP_LOG_TAIL_CHUNKS = 8
+
+# Lines starting with an error or fatal tag in FVP output, e.g. "E: ..." or "F ...".
+_FVP_ERROR_RE = re.compile(r"^[EF][: ]", re.MULTILINE)
+
 
 class QuantizationParams:
     __slots__ = ["node_name", "zp", "scale", "qmin", "qmax", "dtype"]
@@ -55,6 +94,18 @@ class QuantizationParams:
         self.dtype = dtype
 
 
+def _qp_from_node(node: Node) -> QuantizationParams:
+    """Get the QuantizationParams from the args of a (de)quantize node."""
+    return QuantizationParams(
+        node_name=node.args[0].name,
+        scale=node.args[1],
+        zp=node.args[2],
+        qmin=node.args[3],
+        qmax=node.args[4],
+        dtype=node.args[5],
+    )
+
+
 def _get_input_names(program: ExportedProgram) -> list[str]:
     """
     Get a list[str] with the names of the inputs to this model.
@@ -64,55 +115,45 @@ def _get_input_names(program: ExportedProgram) -> list[str]:
     Returns:
         A list of strings with the names of the model input.
     """
-    input_names = []
-
     # E.g. bias and weights are 'placeholders' as well. This is used to
     # get only the use inputs.
-    usr_inputs = program.graph_signature.user_inputs
-    for node in program.graph.nodes:
-        if node.op == "placeholder" and node.name in usr_inputs:
-            input_names.append(node.name)
-
-    return input_names
+    input_set = frozenset(program.graph_signature.user_inputs)
+    return [
+        node.name
+        for node in program.graph.nodes
+        if node.op == "placeholder" and node.name in input_set
+    ]
 
 
 def _get_input_quantization_params(
     program: ExportedProgram,
-) -> list[QuantizationParams]:
+) -> dict[str, QuantizationParams]:
     """
     Get input QuantizationParams in a program, maximum one per input to the program.
+
     Args:
         program (ExportedProgram): The program to get input quantization parameters from.
     Returns:
-        list[QuantizationParams]: The found quantization parameters.
-    Raises:
-        RuntimeError if no quantization parameters are found.
+        A dict mapping input name to its QuantizationParams. The dict is empty
+        for a program that is not quantized.
     """
+    qp_by_name: dict[str, QuantizationParams] = {}
 
-    quant_params = []
-    input_names = _get_input_names(program)
-    num_inputs = len(input_names)
+    input_set = frozenset(program.graph_signature.user_inputs)
     for node in program.graph.nodes:
         if (
-            node.target == torch.ops.quantized_decomposed.quantize_per_tensor.default
-            and node.args[0].name in input_names
+            node.target is _QPT
+            and node.args[0].name in input_set
+            # Keep the first quantize node in graph order for each input.
+            and node.args[0].name not in qp_by_name
         ):
-            qp = QuantizationParams(
-                node_name=node.args[0].name,
-                scale=node.args[1],
-                zp=node.args[2],
-                qmin=node.args[3],
-                qmax=node.args[4],
-                dtype=node.args[5],
-            )
-            quant_params.append(qp)
-            if (
-                len(quant_params) == num_inputs
-            ):  # break early if we have all the inputs quantized parameters
+            qp_by_name[node.args[0].name] = _qp_from_node(node)
+            # Input quantize nodes sit near the top of the graph, so break
+            # early once all inputs have their quantization parameters.
+            if len(qp_by_name) == len(input_set):
                 break
-    if len(quant_params) == 0:
-        raise RuntimeError("No Quantization parameters found in exported model.")
-    return quant_params
+
+    return qp_by_name
 
 
 def _get_output_nodes(program: ExportedProgram) -> list[Node]:
@@ -124,43 +165,56 @@ def _get_output_nodes(program: ExportedProgram) -> list[Node]:
     Returns:
         The nodes that are the outputs of the 'program'.
     """
+    # A graph has a single output node, which is its last node.
     output_nodes = []
-    for node in program.graph.nodes:
+    for node in reversed(program.graph.nodes):
         if node.op == "output":
-            for output in node.args[0]:
-                output_nodes.append(output)
+            output_nodes = list(node.args[0])
+            break
     if len(output_nodes) == 0:
         raise RuntimeError("No output nodes found.")
-    else:
-        return output_nodes
+    return output_nodes
+
+
+def _scan_exported(
+    program: ExportedProgram,
+) -> tuple[list[Node], dict[str, QuantizationParams]]:
+    """
+    Get the output nodes and the input QuantizationParams of this model.
+
+    The output node is read from the end of the graph, and the search for
+    input quantize nodes stops once every input has its parameters, so
+    usually only the start and the end of the graph are visited.
+
+    Args:
+        program (ExportedProgram): The program to scan.
+    Returns:
+        A tuple of the nodes that are the outputs of the 'program', and a dict
+        mapping input name to its QuantizationParams.
+    Raises:
+        RuntimeError if no output nodes are found.
+    """
+    return _get_output_nodes(program), _get_input_quantization_params(program)
 
 
 def _get_output_quantization_params(
     output_nodes: list[Node],
-) -> List[QuantizationParams]:
+) -> List[Optional[QuantizationParams]]:
     """
-    Get output QuantizationParams from a program.
+    Get output QuantizationParams from a program, one entry per output node.
     Args:
         output_nodes (list(Node)): A list of output nodes to get output quantization parameters from.
     Returns:
-        QuantizationParams: The found quantization parameters.
+        list[QuantizationParams | None]: The found quantization parameters,
+            aligned with 'output_nodes'. Outputs that are not dequantized, e.g.
+            bool outputs, get None.
     Raises:
         RuntimeError if no output quantization parameters are found.
     """
-    quant_params = []
-    for node in output_nodes:
-        if node.target == torch.ops.quantized_decomposed.dequantize_per_tensor.default:
-            quant_params.append(
-                QuantizationParams(
-                    node_name=node.args[0].name,
-                    scale=node.args[1],
-                    zp=node.args[2],
-                    qmin=node.args[3],
-                    qmax=node.args[4],
-                    dtype=node.args[5],
-                )
-            )
-    if len(quant_params) == 0:
+    quant_params = [
+        _qp_from_node(node) if node.target is _DQPT else None for node in output_nodes
+    ]
+    if all(qp is None for qp in quant_params):
         raise RuntimeError("No Quantization parameters not found in exported model.")
     return quant_params
 
@@ -180,7 +234,8 @@ class TosaReferenceModelDispatch(TorchFunctionMode):
         return run_tosa_graph_static(tosa_buffer, tosa_version, inputs)
 
     def __torch_function__(self, func, types, args=..., kwargs=None):
-        if isinstance(func, torch._higher_order_ops.executorch_call_delegate.ExecutorchCallDelegate):  # type: ignore
+        # Identity check on the type keeps the common non-delegate path cheap.
+        if type(func) is ExecutorchCallDelegate:
             lowered_backend_module = cast(LoweredBackendModule, args[0])
             if lowered_backend_module.backend_id == "ArmBackend":
                 return self._tosa_dispatch(lowered_backend_module, args[1:])
@@ -214,10 +269,11 @@ class RunnerUtil:
         self.input_names: list[str] = None
         self.output_name: str = None
         self.qp_input: list[QuantizationParams] = None
-        self.qp_output: list[QuantizationParams] = None
+        self.qp_output: list[Optional[QuantizationParams]] = None
         self.timeout = 480
         self.target_board: str = None
 
+        self._fvp_cmd_template: Optional[tuple[bool, tuple[list[str], str, int]]] = None
         self._has_init_run = False
 
     def init_run(
@@ -229,49 +285,47 @@ class RunnerUtil:
     ):
 
         self.input_names = _get_input_names(edge_program)
-        self.output_nodes = _get_output_nodes(exported_program)
+        self.output_nodes, qp_by_name = _scan_exported(exported_program)
 
         self.is_quantized = is_quantized
         self.target_board = target_board
 
         if is_quantized:
-            self.qp_input = _get_input_quantization_params(exported_program)
+            if len(qp_by_name) == 0:
+                raise RuntimeError(
+                    "No Quantization parameters found in exported model."
+                )
+            # Inputs that are not quantized, e.g. int or bool inputs, get None.
+            self.qp_input = [qp_by_name.get(name) for name in self.input_names]
             self.qp_output = _get_output_quantization_params(self.output_nodes)
         else:
             self.qp_input = [None] * len(self.input_names)
             self.qp_output = [None] * len(self.output_nodes)
 
+        self._fvp_cmd_template = None
         self._has_init_run = True
 
     def set_timeout(self, timeout: int):
         self.timeout = timeout
+        self._fvp_cmd_template = None
 
-    def run_corstone(
-        self,
-        inputs: Tuple[torch.Tensor],
-    ) -> list[torch.Tensor]:
-
-        assert (
-            self._has_init_run
-        ), "RunnerUtil needs to be initialized using init_run() before running Corstone FVP."
-        if self.target_board not in ["corstone-300", "corstone-320"]:
-            raise RuntimeError(f"Unknown target board: {self.target_board}")
-
-        pte_path = os.path.join(self.intermediate_path, "program.pte")
-        assert os.path.exists(pte_path), f"Pte path '{pte_path}' not found."
-
-        for input_name, quant_param, data in zip(
-            self.input_names, self.qp_input, inputs
-        ):
-            save_bytes(self.intermediate_path, data, False, input_name, quant_param)
+    def _get_fvp_cmd_template(self) -> tuple[list[str], str, int]:
+        """
+        Validate the .elf path and build the static part of the FVP command for
+        the target board. The result is cached until the next init_run() or
+        set_timeout(), or until the fast_fvp option changes.
 
-        out_path = os.path.join(self.intermediate_path, "out")
+        Returns:
+            A tuple of the FVP command, the semihosting cmd_line parameter name
+            and the index of the cmd_line entry in the command. That entry must
+            be replaced by "<parameter name>='<cmd_line>'" before running.
+        """
+        fast_fvp = is_option_enabled("fast_fvp")
+        if self._fvp_cmd_template is not None:
+            cached_fast_fvp, template = self._fvp_cmd_template
+            if cached_fast_fvp == fast_fvp:
+                return template
 
-        input_paths = []
-        for name in self.input_names:
-            input_paths.append(
-                os.path.join(self.intermediate_path, f"{name}.bin"),
-            )
         elf_path = os.path.join(
             "cmake-out",
             f"arm_semihosting_executor_runner_{self.target_board}",
@@ -281,15 +335,14 @@ class RunnerUtil:
             elf_path
         ), f"Did not find build arm_executor_runner in path {elf_path}, run setup_testing.sh?"
 
-        cmd_line = f"executor_runner -m {pte_path} -o {out_path}"
-
-        for input_path in input_paths:
-            cmd_line += f" -i {input_path}"
-
         ethos_u_extra_args = ""
-        if is_option_enabled("fast_fvp"):
+        if fast_fvp:
             ethos_u_extra_args = ethos_u_extra_args + "--fast"
 
+        cmd_line_param = {
+            "corstone-300": "cpu0.semihosting-cmd_line",
+            "corstone-320": "mps4_board.subsystem.cpu0.semihosting-cmd_line",
+        }[self.target_board]
         command_args = {
             "corstone-300": [
                 "FVP_Corstone_SSE-300_Ethos-U55",
@@ -310,7 +363,7 @@ class RunnerUtil:
                 "-C",
                 "cpu0.semihosting-heap_limit=0",
                 "-C",
-                f"cpu0.semihosting-cmd_line='{cmd_line}'",
+                cmd_line_param,
                 "-a",
                 elf_path,
                 "--timelimit",
@@ -341,35 +394,77 @@ class RunnerUtil:
                 "-C",
                 f"mps4_board.subsystem.ethosu.extra_args='{ethos_u_extra_args}'",
                 "-C",
-                f"mps4_board.subsystem.cpu0.semihosting-cmd_line='{cmd_line}'",
+                cmd_line_param,
                 "-a",
                 elf_path,
                 "--timelimit",
                 f"{self.timeout}",
             ],
         }
+        fvp_cmd = command_args[self.target_board]
+        template = (fvp_cmd, cmd_line_param, fvp_cmd.index(cmd_line_param))
+
+        self._fvp_cmd_template = (fast_fvp, template)
+        return template
+
+    def run_corstone(
+        self,
+        inputs: Tuple[torch.Tensor],
+    ) -> list[torch.Tensor]:
 
-        result = _run_cmd(command_args[self.target_board], check=False)
-        if result.returncode != 0:
+        assert (
+            self._has_init_run
+        ), "RunnerUtil needs to be initialized using init_run() before running Corstone FVP."
+        if self.target_board not in ["corstone-300", "corstone-320"]:
+            raise RuntimeError(f"Unknown target board: {self.target_board}")
+
+        pte_path = os.path.join(self.intermediate_path, "program.pte")
+        assert os.path.exists(pte_path), f"Pte path '{pte_path}' not found."
+
+        _save_inputs(
+            save_bytes,
+            [
+                (self.intermediate_path, data, False, input_name, quant_param)
+                for input_name, quant_param, data in zip(
+                    self.input_names, self.qp_input, inputs
+                )
+            ],
+        )
+
+        input_paths = [
+            os.path.join(self.intermediate_path, f"{name}.bin")
+            for name in self.input_names
+        ]
+        out_path = os.path.join(self.intermediate_path, "out")
+        fvp_cmd_template, cmd_line_param, cmd_line_index = self._get_fvp_cmd_template()
+
+        cmd_line = f"executor_runner -m {pte_path} -o {out_path}"
+        for input_path in input_paths:
+            cmd_line += f" -i {input_path}"
+
+        fvp_cmd = fvp_cmd_template[:]
+        fvp_cmd[cmd_line_index] = f"{cmd_line_param}='{cmd_line}'"
+
+        returncode, found_error, result_stdout, result_stderr = _run_fvp(fvp_cmd)
+        if returncode != 0:
             raise RuntimeError(
-                f"Failed to run {command_args[self.target_board]}\nOutput:\n{result.stdout.decode()}\nError: {result.stderr.decode()}"
+                f"Failed to run {fvp_cmd}\nOutput:\n{result_stdout}\nError: {result_stderr}"
             )
-        result_stdout = result.stdout.decode()
-
-        error_regex = r"(^[EF][: ].*$)|(^.*Hard fault.*$)|(^.*Assertion.*$)"
 
         # Check for errors in the output
-        # regex to check for error or fault messages in stdout from FVP
-        if re.compile(error_regex, re.MULTILINE).search(result_stdout):
+        if found_error:
             raise RuntimeError(
-                f"Corstone simulation failed:\ncmd: {command_args[self.target_board]}\n, log: \n {result_stdout}\n{result.stderr.decode()}"
+                f"Corstone simulation failed:\ncmd: {fvp_cmd}\n, log: \n {result_stdout}\n{result_stderr}"
             )
         output_np = []
         for i, node in enumerate(self.output_nodes):
+            output_shape = node.meta["val"].shape
+            # Read exactly the expected number of elements into a single buffer.
             tosa_ref_output = np.fromfile(
-                os.path.join(self.intermediate_path, f"out-{i}.bin"), dtype=np.float32
+                os.path.join(self.intermediate_path, f"out-{i}.bin"),
+                dtype=np.float32,
+                count=math.prod(output_shape),
             )
-            output_shape = node.meta["val"].shape
             output_np.append(torch.from_numpy(tosa_ref_output).reshape(output_shape))
         return tuple(output_np)
 
@@ -400,16 +495,14 @@ class RunnerUtil:
         ), "Non-valid TOSA given to reference model."
 
         outputs_torch = []
-        for output in outputs:
-            output = torch.from_numpy(output)
+        for i, output in enumerate(outputs):
             if self.is_quantized:
                 # Need to dequant back to FP32 for comparison with torch output
-                quant_param = self.qp_output
-                assert (
-                    quant_param is not None
-                ), "There are no quantization parameters, check output parameters"
-                output = (output.to(torch.float32) - quant_param.zp) * quant_param.scale
-            outputs_torch.append(output)
+                quant_param = self.qp_output[i]
+                if quant_param is not None:
+                    # I.e. bool output is possible for quantized models
+                    output = _dequantize_to_fp32(output, quant_param)
+            outputs_torch.append(torch.from_numpy(output))
         return tuple(outputs_torch)
 
     def run_tosa_ref_model(
@@ -483,12 +576,15 @@ class RunnerUtil:
         # Save the input data to disk as a .npy file, since that's what the TOSA
         # reference model expects. Name of the file must match the name in
         # desc.json, which is the tensor name from the graph + .npy
-        for input_name, quant_param, data in zip(
-            self.input_names, self.qp_input, inputs, strict=True
-        ):
-            save_npy(
-                self.intermediate_path, data, self.is_quantized, input_name, quant_param
-            )
+        _save_inputs(
+            save_npy,
+            [
+                (self.intermediate_path, data, self.is_quantized, input_name, qp)
+                for input_name, qp, data in zip(
+                    self.input_names, self.qp_input, inputs, strict=True
+                )
+            ],
+        )
 
         # Run the TOSA reference model via command line, this will produce a
         # .npy file with the result (aka OFM).
@@ -506,11 +602,11 @@ class RunnerUtil:
         _run_cmd(cmd_ref_model)
 
         # Load desc.json, just to get the name of the output file above
-        with open(desc_file_path) as f:
-            desc_json = json.load(f)
+        with open(desc_file_path, "rb") as f:
+            desc_json = _json_loads(f.read())
 
         tosa_ref_outputs = []
-        for ofm_file in desc_json["ofm_file"]:
+        for i, ofm_file in enumerate(desc_json["ofm_file"]):
             ofm_file_npy = os.path.join(self.intermediate_path, ofm_file)
 
             # Load the output file (OFM) and return it as a numpy array
@@ -518,15 +614,10 @@ class RunnerUtil:
 
             if self.is_quantized:
                 # Need to dequant back to FP32 for comparison with torch output
-                # Convert to int32 prior to dequantize the output
-                if tosa_ref_output.dtype == np.int8:
-                    tosa_ref_output = tosa_ref_output.astype(np.int32)
-                quant_param = self.qp_output
+                quant_param = self.qp_output[i]
                 if quant_param is not None:
                     # I.e. bool output is possible for quantized models
-                    tosa_ref_output = (
-                        tosa_ref_output - quant_param.zp
-                    ) * quant_param.scale
+                    tosa_ref_output = _dequantize_to_fp32(tosa_ref_output, quant_param)
 
             if tosa_ref_output.dtype == np.double:
                 tosa_ref_output = tosa_ref_output.astype("float32")
@@ -541,31 +632,67 @@ class RunnerUtil:
 
 
 def prep_data_for_save(
-    data: torch.Tensor,
+    data: np.ndarray | torch.Tensor,
     is_quantized: bool,
     input_name: str,
     quant_param: QuantizationParams,
 ):
-    data_np = np.array(data.detach(), order="C").astype(
-        f"{data.dtype}".replace("torch.", "")
-    )
+    # Zero-copy view of the (contiguous) data where possible.
+    if isinstance(data, np.ndarray):
+        # Unlike np.ascontiguousarray, this keeps the shape of 0-d arrays.
+        data_np = np.asarray(data, order="C")
+    else:
+        data_np = data.detach().contiguous().numpy()
 
     if is_quantized:
+        assert (
+            quant_param is not None
+        ), f"No quantization params found for input tensor '{input_name}'."
         assert quant_param.node_name in input_name, (
             f"The quantization params name '{quant_param.node_name}' does not "
             f"match the input tensor name '{input_name}'."
         )
-        data_np = (
-            ((data_np / np.float32(quant_param.scale)) + quant_param.zp)
-            .round()
-            .clip(quant_param.qmin, quant_param.qmax)
-            .astype(
-                f"{quant_param.dtype}".replace("torch.", "")
-            )  # Use string format of dtype to convert to numpy dtype
-        )
+        data_np = _quantize(data_np, quant_param)
     return data_np
 
 
+def _quantize(data: np.ndarray, quant_param: QuantizationParams) -> np.ndarray:
+    """Quantizes the C-contiguous array 'data' using 'quant_param'.
+
+    The data is processed in cache-sized blocks, so each element is read from
+    and written to memory once, directly into the quantized output.
+    """
+    out = np.empty(data.shape, dtype=_TORCH_TO_NUMPY[quant_param.dtype])
+    src = data.reshape(-1)
+    dst = out.reshape(-1)
+    inv_scale = np.float32(1.0 / quant_param.scale)
+    block = np.empty(min(_QUANTIZE_BLOCK_SIZE, src.size), dtype=np.float32)
+    for start in range(0, src.size, _QUANTIZE_BLOCK_SIZE):
+        src_block = src[start : start + _QUANTIZE_BLOCK_SIZE]
+        buf = block[: src_block.size]
+        np.multiply(src_block, inv_scale, out=buf)
+        np.add(buf, quant_param.zp, out=buf)
+        np.rint(buf, out=buf)
+        np.clip(buf, quant_param.qmin, quant_param.qmax, out=buf)
+        np.copyto(dst[start : start + src_block.size], buf, casting="unsafe")
+    return out
+
+
+def _dequantize_to_fp32(
+    data: np.ndarray, quant_param: QuantizationParams
+) -> np.ndarray:
+    """Dequantizes 'data' to float32, computing into a single output buffer."""
+    if data.dtype.itemsize > 2:
+        # float32 can't represent all integers wider than 16 bits exactly, so
+        # compute in float64 and cast the result.
+        return ((data - np.float64(quant_param.zp)) * quant_param.scale).astype(
+            np.float32
+        )
+    data_fp32 = np.subtract(data, quant_param.zp, dtype=np.float32)
+    np.multiply(data_fp32, np.float32(quant_param.scale), out=data_fp32)
+    return data_fp32
+
+
 def save_npy(
     path: str,
     data,
@@ -612,12 +739,48 @@ def save_bytes(
     data_np = prep_data_for_save(data, is_quantized, input_name, quant_param)
     file_path = os.path.join(path, input_name + ".bin")
     with open(file_path, "w+b") as f:
-        data_np_bytes = data_np.tobytes()
-        f.write(data_np_bytes)
+        # Write straight from the array buffer, without an intermediate bytes copy.
+        np.ascontiguousarray(data_np).tofile(f)
 
     return file_path
 
 
+def _has_fvp_error(fvp_output: str) -> bool:
+    """Checks for error or fault messages in stdout from FVP."""
+    # Plain substring checks are much cheaper than a regex with leading '.*'
+    # on large logs; only the line-start check needs the regex.
+    return (
+        "Hard fault" in fvp_output
+        or "Assertion" in fvp_output
+        or _FVP_ERROR_RE.search(fvp_output) is not None
+    )
+
+
+@functools.lru_cache(maxsize=None)
+def _get_io_pool() -> concurrent.futures.ThreadPoolExecutor:
+    """Returns the shared pool for saving model inputs, created on first use."""
+    return concurrent.futures.ThreadPoolExecutor(
+        max_workers=min(8, os.cpu_count() or 1)
+    )
+
+
+def _save_inputs(save_fn: Callable[..., str], save_args: list[tuple]) -> None:
+    """Calls 'save_fn' once per tuple of arguments in 'save_args'.
+
+    Inputs are independent, so with more than one input they are saved in
+    parallel; the NumPy work and file writes release the GIL.
+    """
+    if len(save_args) <= 1:
+        for args in save_args:
+            save_fn(*args)
+        return
+
+    pool = _get_io_pool()
+    save_futures = [pool.submit(save_fn, *args) for args in save_args]
+    for future in save_futures:
+        future.result()
+
+
 def _run_cmd(cmd: List[str], check=True) -> subprocess.CompletedProcess[bytes]:
     """
     Run a command and check for errors.
@@ -635,6 +798,64 @@ def _run_cmd(cmd: List[str], check=True) -> subprocess.CompletedProcess[bytes]:
         )
 
 
+def _run_fvp(cmd: List[str]) -> tuple[int, bool, str, str]:
+    """
+    Run an FVP command, scanning its stdout for error messages while it runs.
+
+    Stdout is read in chunks and only the last _FVP_LOG_TAIL_CHUNKS chunks are
+    kept, so large logs are not buffered in full. Once an error is found, all
+    following output is kept as well.
+
+    Args:
+    cmd (List[str]): The command to run as a list.
+    Returns:
+        A tuple of the return code, whether an error was found in stdout, the
+        kept stdout and the stderr.
+    """
+    with subprocess.Popen(
+        cmd,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        bufsize=_FVP_LOG_CHUNK_SIZE,
+    ) as proc:
+        # Drain stderr concurrently so the process can't block on a full pipe.
+        stderr_chunks: list[bytes] = []
+        stderr_reader = threading.Thread(
+            target=lambda: stderr_chunks.append(proc.stderr.read())
+        )
+        stderr_reader.start()
+
+        decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        kept_stdout: collections.deque[str] | list[str] = collections.deque(
+            maxlen=_FVP_LOG_TAIL_CHUNKS
+        )
+        found_error = False
+        # Trailing partial line of the previous chunk, scanned with the next one.
+        unscanned = ""
+        while chunk := proc.stdout.read(_FVP_LOG_CHUNK_SIZE):
+            text = decoder.decode(chunk)
+            kept_stdout.append(text)
+            if found_error:
+                continue
+            lines, sep, unscanned = (unscanned + text).rpartition("\n")
+            if _has_fvp_error(lines + sep):
+                found_error = True
+                kept_stdout = list(kept_stdout)
+        text = decoder.decode(b"", final=True)
+        if text:
+            # Don't let an empty flush push a real chunk out of the tail.
+            kept_stdout.append(text)
+        if not found_error:
+            found_error = _has_fvp_error(unscanned + text)
+
+        stderr_reader.join()
+        returncode = proc.wait()
+
+    stdout = "".join(kept_stdout)
+    stderr = b"".join(stderr_chunks).decode()
+    return returncode, found_error, stdout, stderr
+
+
 def dbg_tosa_fb_to_json(tosa_fb: bytes) -> Dict:
     """
     This function is used to dump the TOSA flatbuffer to a human readable
@@ -667,8 +888,8 @@ def dbg_tosa_fb_to_json(tosa_fb: bytes) -> Dict:
         tosa_input_file,
     ]
     _run_cmd(cmd_flatc)
-    with open(os.path.join(tmp, "output.json"), "r") as f:
-        json_out = json.load(f)
+    with open(os.path.join(tmp, "output.json"), "rb") as f:
+        json_out = _json_loads(f.read())
 
     # Cast float tensors to proper dtype.
     try:
@@ -677,9 +898,9 @@ def dbg_tosa_fb_to_json(tosa_fb: bytes) -> Dict:
                 for tensor in block["tensors"]:
                     if "data" in tensor:
                         if tensor["type"] == "FP32":
-                            data = np.array(tensor["data"])
-                            data = data.astype(np.int8)
-                            data = np.frombuffer(data, dtype=np.float32)
+                            # The data is serialized as a list of raw bytes.
+                            data = np.asarray(tensor["data"], dtype=np.uint8)
+                            data = data.view(np.float32)
                         data = data.reshape(tensor["shape"])
                         tensor["data"] = data
     except Exception:
@@ -689,20 +910,23 @@ def dbg_tosa_fb_to_json(tosa_fb: bytes) -> Dict:
     return json_out
 
 
+_LOGLEVEL_MAP = {
+    logging.INFO: "INFO",
+    logging.CRITICAL: "LOW",
+    logging.ERROR: "LOW",
+    logging.WARNING: "MED",
+    logging.DEBUG: "HIGH",
+    logging.NOTSET: "MED",
+}
+
+
+@functools.lru_cache(maxsize=8)
 def _tosa_refmodel_loglevel(loglevel: int) -> str:
     """Converts a logging loglevel to tosa_reference_model logginglevel,
     returned as string.
     """
-    loglevel_map = {
-        logging.INFO: "INFO",
-        logging.CRITICAL: "LOW",
-        logging.ERROR: "LOW",
-        logging.WARNING: "MED",
-        logging.DEBUG: "HIGH",
-        logging.NOTSET: "MED",
-    }
     clamped_logging_level = max(min(loglevel // 10 * 10, 50), 0)
-    return loglevel_map[clamped_logging_level]
+    return _LOGLEVEL_MAP[clamped_logging_level]
 
 
 def run_tosa_graph_static(
@@ -711,7 +935,7 @@ def run_tosa_graph_static(
     inputs: list[torch.Tensor],
 ) -> list[torch.Tensor]:
     """Runs the TOSA reference model with inputs and returns the result."""
-    inputs_np = [input.numpy() for input in inputs]
+    inputs_np = [input.detach().numpy() for input in inputs]
     transpose_data_format(inputs_np, to="NHWC")
 
     tosa_release = tosa_version.version
@@ -736,7 +960,7 @@ def run_tosa_graph_static(
     ), "Non-valid TOSA given to reference model."
 
     transpose_data_format(outputs_np, to="NCHW")
-    return [torch.from_numpy(output) for output in outputs_np]
+    return [torch.as_tensor(output) for output in outputs_np]
 
 
 def transpose_data_format(data: list[np.ndarray], to: Literal["NHWC", "NCHW"]):
@@ -744,7 +968,8 @@ def transpose_data_format(data: list[np.ndarray], to: Literal["NHWC", "NCHW"]):
         dim_order = (0, 3, 1, 2)
     if to == "NHWC":
         dim_order = (0, 2, 3, 1)
-    for i in range(len(data)):
-        if hasattr(data[i], "shape") and len(data[i].shape) == 4:
-            # Copy is needed to force actual data conversion, not setting stride.
-            data[i] = np.transpose(data[i], dim_order).copy()
+    for i, arr in enumerate(data):
+        if hasattr(arr, "shape") and arr.ndim == 4:
+            # A contiguous array is needed to force actual data conversion, not
+            # setting stride.
+            data[i] = np.ascontiguousarray(arr.transpose(dim_order))
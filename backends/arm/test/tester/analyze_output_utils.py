@@ -229,7 +229,7 @@ def dump_error_output(
     quantize_stage = tester.stages.get(tester.stage_name(Quantize), None)
     if export_stage is not None and quantize_stage is not None:
         output_nodes = _get_output_nodes(export_stage.artifact)
-        qp_input = _get_input_quantization_params(export_stage.artifact)
+        qp_input = list(_get_input_quantization_params(export_stage.artifact).values())
         qp_output = _get_output_quantization_params(output_nodes)
         logger.error(f"Input QuantArgs: {qp_input}")
         logger.error(f"Output QuantArgs: {qp_output}")
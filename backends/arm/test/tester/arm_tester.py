@@ -316,7 +316,10 @@ class ArmTester(Tester):
             # bool output is quantized with none quantized output so allow
             # self.runner_util.qp_output to be none
             if self.runner_util.qp_output is not None:
-                quantization_scales = [qp.scale for qp in self.runner_util.qp_output]
+                quantization_scales = [
+                    qp.scale if qp is not None else None
+                    for qp in self.runner_util.qp_output
+                ]
         else:
             quantization_scales = [None] * len(self.runner_util.output_nodes)
             reference_stage = self.stages[self.stage_name(InitialModel)]